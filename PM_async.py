@@ -0,0 +1,107 @@
+import asyncio
+
+from PM_backend import prodman_backend, COMPLETE
+from PM_timing import NS_PER_SECOND
+
+
+class async_prodman_backend(prodman_backend):
+    """
+    prodman_backend whose session runs as a coroutine on an asyncio event loop instead of on a thread of its own.
+    the state machine, snapshots and readers are the same; start() is awaited, inputs are delivered through an
+    asyncio.Queue, and the database work has awaitable versions that run in the loop's executor.
+    many sessions can share one loop (e.g. an async web server's), and a session is stopped by cancelling its task,
+    which finishes it first so its timeline and totals stay closed.
+    the session waits on the loop's own timers, so it always runs on real time (no simulated clock).
+    """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.loop = None
+        self.inputs = None
+
+    def set_input_from_dash(self, dash_input):
+        """callable from any thread: queued for the running session, or applied right away when there is none"""
+        loop = self.loop
+        if loop is None:
+            return super().set_input_from_dash(dash_input)
+        loop.call_soon_threadsafe(self.inputs.put_nowait, dash_input)
+
+    async def put_input(self, dash_input):
+        if self.loop is None:
+            await self.apply_input(dash_input)
+        else:
+            await self.inputs.put(dash_input)
+
+    async def apply_input(self, dash_input):
+        with self.state_condition:
+            self.handle_input(dash_input, self.now_ns())
+            effects = self.take_effects()
+            self.publish_if_dirty()
+        self.run_effects(effects)
+        if dash_input == "record":
+            await self.record_session_async()
+
+    async def start(self, resume=False):
+        """
+        runs the deployed schedule until the session completes, waiting on the loop until the next deadline
+        (block end, ding, hassler prompt) or the next input. resume=True drives a session already under way.
+        """
+        if (not resume) and (not self.begin()):
+            return
+        self.loop = asyncio.get_running_loop()
+        self.inputs = asyncio.Queue()
+        try:
+            while True:
+                version, phase, deadline_ns = self.step()
+                if phase == COMPLETE:
+                    return
+                if self.console_output:
+                    self.print_stats()
+
+                # the stats refresh is only worth waking up for when there are stats to print
+                if self.console_output and (self.refresh_interval is not None):
+                    deadline_ns = self.next_wakeup(deadline_ns, self.now_ns() + int(self.refresh_interval*NS_PER_SECOND))
+                timeout = None
+                if deadline_ns is not None:
+                    timeout = max((deadline_ns - self.now_ns())/NS_PER_SECOND, 0)
+                try:
+                    dash_input = await asyncio.wait_for(self.inputs.get(), timeout)
+                except asyncio.TimeoutError:
+                    continue
+                await self.apply_input(dash_input)
+        except asyncio.CancelledError:
+            with self.state_condition:
+                if self.phase != COMPLETE:
+                    self.finish_session(self.now_ns())
+                effects = self.take_effects()
+                self.publish_if_dirty()
+            self.run_effects(effects)
+            raise
+        finally:
+            self.loop = None
+
+    #### AWAITABLE DATABASE FUNCTIONS
+    # the blocking versions run in the loop's default executor, so the loop keeps serving other sessions
+
+    async def run_blocking(self, function, *args):
+        return await asyncio.get_running_loop().run_in_executor(None, function, *args)
+
+    async def record_session_async(self, session_name=None):
+        return await self.run_blocking(self.record_session, session_name)
+
+    async def get_history_async(self, start_date, end_date):
+        return await self.run_blocking(self.get_history, start_date, end_date)
+
+    async def get_templates_async(self, audio=True):
+        return await self.run_blocking(self.get_templates, audio)
+
+    async def save_template_async(self, template_id, template, vocalize=True):
+        return await self.run_blocking(self.save_template, template_id, template, vocalize)
+
+    async def save_templates_async(self, templates, vocalize=True):
+        return await self.run_blocking(self.save_templates, templates, vocalize)
+
+    async def delete_template_async(self, template_id):
+        return await self.run_blocking(self.delete_template, template_id)
+
+    async def delete_from_history_async(self, session_dates, session_ids):
+        return await self.run_blocking(self.delete_from_history, session_dates, session_ids)
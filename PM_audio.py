@@ -0,0 +1,334 @@
+import os
+import sys
+import time
+import wave
+import hashlib
+import threading
+import subprocess
+from array import array
+from collections import deque, namedtuple, OrderedDict
+
+import PM_config
+
+try:
+    import aifc
+except ImportError: # removed from the standard library in python 3.13
+    aifc = None
+
+
+#### SOUND BUFFERS
+
+sound_buffer = namedtuple('sound_buffer', ['path', 'channels', 'sample_width', 'rate', 'frames', 'big_endian'])
+
+def load_sound(path):
+    """decodes a .wav / .aiff file into an in-memory sound_buffer (None if it cannot be read)"""
+    if (path is None) or (not os.path.isfile(path)):
+        print("AUDIO: sound file not found: {}".format(path))
+        return None
+    try:
+        if path.lower().endswith(('.aiff', '.aif')):
+            if aifc is None:
+                return sound_buffer(path, None, None, None, None, True)
+            reader, big_endian = aifc.open(path, 'rb'), True
+        else:
+            reader, big_endian = wave.open(path, 'rb'), False
+        with reader:
+            return sound_buffer(path, reader.getnchannels(), reader.getsampwidth(), reader.getframerate(), reader.readframes(reader.getnframes()), big_endian)
+    except Exception as e:
+        print("AUDIO: could not decode {}: {}".format(path, e))
+        return None
+
+def scale_frames(sound, volume):
+    """16 bit little/big endian frames -> native endian 16 bit frames scaled by volume (clipped)"""
+    samples = array('h', sound.frames)
+    if sound.big_endian != (sys.byteorder == 'big'):
+        samples.byteswap()
+    if volume != 1:
+        samples = array('h', (max(-32768, min(32767, int(s*volume))) for s in samples))
+    return samples.tobytes()
+
+
+#### BACKENDS
+# a backend plays one cue at a time on the audio worker's thread: say(text, volume) and play(sound_buffer, volume)
+
+class null_audio_backend:
+    """drops every cue; for headless runs, benchmarks and replays"""
+    def say(self, text, volume):
+        pass
+
+    def play(self, sound, volume):
+        pass
+
+
+class command_audio_backend:
+    """base for backends that shell out; a missing command disables that kind of cue instead of failing every time"""
+    def __init__(self):
+        self.missing = set()
+
+    def run(self, args, data=None):
+        if args[0] in self.missing:
+            return
+        try:
+            if data is None:
+                subprocess.run(args, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            else:
+                subprocess.run(args, input=data, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        except OSError:
+            print("AUDIO: '{}' is not available, its cues will be skipped".format(args[0]))
+            self.missing.add(args[0])
+
+
+class macos_audio_backend(command_audio_backend):
+    """say / afplay. afplay reads the file itself, so the decoded buffer only serves to validate the file"""
+    def say(self, text, volume):
+        self.run(['say', '[[volm {}]] {}'.format(volume, text)])
+
+    def play(self, sound, volume):
+        self.run(['afplay', '-v', str(volume), sound.path])
+
+
+class linux_audio_backend(command_audio_backend):
+    """
+    espeak / aplay. sounds are streamed to aplay from the preloaded buffers, rescaled when their volume changes.
+    only the frames at the latest volume are kept per sound, so dragging a volume slider does not pile up copies.
+    """
+    def __init__(self):
+        super().__init__()
+        self.scaled = {}    # sound path -> (volume, scaled frames)
+
+    def say(self, text, volume):
+        self.run(['espeak', '-a', str(int(volume*200)), text])
+
+    def play(self, sound, volume):
+        if sound.frames is None:
+            return
+        if sound.sample_width == 2:
+            cached = self.scaled.get(sound.path)
+            if (cached is None) or (cached[0] != volume):
+                cached = self.scaled[sound.path] = (volume, scale_frames(sound, volume))
+            data = cached[1]
+            sample_format = 'S16_LE' if sys.byteorder == 'little' else 'S16_BE'
+        else:
+            data = sound.frames
+            sample_format = {1: 'U8', 3: 'S24_3BE' if sound.big_endian else 'S24_3LE', 4: 'S32_BE' if sound.big_endian else 'S32_LE'}[sound.sample_width]
+        self.run(['aplay', '-q', '-t', 'raw', '-f', sample_format, '-r', str(sound.rate), '-c', str(sound.channels), '-'], data)
+
+
+def make_audio_backend(name=None):
+    if name is None: name = PM_config.audio_backend
+    if name == 'auto':
+        name = {'darwin': 'macos', 'linux': 'linux'}.get(sys.platform, 'null')
+    return {'macos': macos_audio_backend, 'linux': linux_audio_backend, 'null': null_audio_backend}[name]()
+
+
+#### TEXT TO SPEECH
+# an engine renders a phrase into a sound file: render(text, volume, path). the file extension is the engine's.
+
+class espeak_tts_engine:
+    name = 'espeak'
+    extension = '.wav'
+
+    def render(self, text, volume, path):
+        subprocess.run(['espeak', '-a', str(int(volume*200)), '-w', path, text], check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+class say_tts_engine:
+    name = 'say'
+    extension = '.aiff'
+
+    def render(self, text, volume, path):
+        subprocess.run(['say', '-o', path, '[[volm {}]] {}'.format(volume, text)], check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def make_tts_engine(name=None):
+    if name is None: name = PM_config.tts_engine
+    if name == 'auto':
+        name = {'darwin': 'say', 'linux': 'espeak'}.get(sys.platform)
+    if name is None:
+        return None
+    return {'espeak': espeak_tts_engine, 'say': say_tts_engine}[name]()
+
+
+class phrase_cache:
+    """
+    phrases rendered once by a tts engine, keyed by (engine, phrase, volume).
+    the files stay on disk across runs, at most max_entries of them, evicting the least recently used (file mtime
+    carries the order between runs); the ones used in this run are also kept decoded in memory.
+    """
+    def __init__(self, engine, directory, max_entries=256):
+        self.engine = engine
+        self.directory = directory
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.failed = False
+
+        os.makedirs(directory, exist_ok=True)
+        # key -> sound_buffer (None until decoded), least recently used first
+        self.entries = OrderedDict()
+        files = [f for f in os.listdir(directory) if f.endswith(engine.extension) and ('.tmp' not in f)]
+        for f in sorted(files, key=lambda f: os.path.getmtime(os.path.join(directory, f))):
+            self.entries[f[:-len(engine.extension)]] = None
+
+    def key(self, text, volume):
+        return hashlib.sha1('{}|{}|{}'.format(self.engine.name, volume, text).encode()).hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.directory, key+self.engine.extension)
+
+    def get(self, text, volume):
+        """the rendered phrase as a sound_buffer, rendering it first if needed (None if the engine failed)"""
+        if self.failed:
+            return None
+        key = self.key(text, volume)
+        path = self.path(key)
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                sound = self.entries[key]
+                if sound is not None:
+                    return sound
+
+        if os.path.isfile(path):
+            os.utime(path)
+        else:
+            # render next to the final file and move it into place, so readers never see a partial file
+            temp_path = os.path.join(self.directory, '{}.{}.tmp{}'.format(key, threading.get_ident(), self.engine.extension))
+            try:
+                self.engine.render(text, volume, temp_path)
+                os.replace(temp_path, path)
+            except OSError:
+                print("AUDIO: tts engine '{}' is not available, prompts will be spoken live".format(self.engine.name))
+                self.failed = True
+                return None
+            except subprocess.CalledProcessError as e:
+                print("AUDIO: could not render '{}': {}".format(text, e))
+                return None
+
+        sound = load_sound(path)
+        with self.lock:
+            self.entries[key] = sound
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                evicted, _ = self.entries.popitem(last=False)
+                try:
+                    os.remove(self.path(evicted))
+                except OSError:
+                    pass
+        return sound
+
+
+#### WORKER
+
+class audio_worker:
+    """
+    one long-lived thread playing audio cues from a bounded queue.
+    queueing a cue never blocks: when the queue is full the oldest cue is dropped, and a cue that waited longer
+    than max_delay seconds is skipped when it comes up, so the latency of the cues that do play stays bounded.
+    with a phrase_cache, speech is replayed from rendered phrases instead of being synthesized on every cue.
+    """
+    def __init__(self, backend, sounds=None, queue_size=8, max_delay=5, tts=None):
+        self.backend = backend
+        self.tts = tts
+        self.max_delay = max_delay
+        # decoded once, up front
+        self.sounds = {name: load_sound(path) for name, path in (sounds or {}).items()}
+
+        self.queue = deque(maxlen=queue_size)
+        self.condition = threading.Condition()
+        self.dropped = 0
+        self.thread = threading.Thread(name='audio', target=self.run, daemon=True)
+        self.thread.start()
+
+    def put(self, cue):
+        with self.condition:
+            if len(self.queue) == self.queue.maxlen:
+                self.dropped += 1
+            self.queue.append(cue)
+            self.condition.notify()
+
+    def say(self, text, volume=1):
+        self.put((time.monotonic(), 'say', text, volume))
+
+    def play(self, sound_name, volume=1):
+        self.put((time.monotonic(), 'play', sound_name, volume))
+
+    def prerender(self, phrases, volume=1):
+        """renders the phrases into the tts cache on a background thread"""
+        if self.tts is None:
+            return
+        def render():
+            for phrase in phrases:
+                if self.tts.get(phrase, volume) is None:
+                    return
+        threading.Thread(name='tts-prerender', target=render, daemon=True).start()
+
+    def stop(self):
+        self.put(None)
+        self.thread.join()
+
+    def run(self):
+        while True:
+            with self.condition:
+                self.condition.wait_for(lambda: len(self.queue)>0)
+                cue = self.queue.popleft()
+            if cue is None:
+                return
+            queued_at, kind, payload, volume = cue
+            if time.monotonic() - queued_at > self.max_delay:
+                self.dropped += 1
+                continue
+            try:
+                if kind == 'say':
+                    sound = None
+                    if self.tts is not None:
+                        sound = self.tts.get(payload, volume)
+                    if sound is not None:
+                        self.backend.play(sound, 1)
+                    else:
+                        self.backend.say(payload, volume)
+                elif self.sounds.get(payload) is not None:
+                    self.backend.play(self.sounds[payload], volume)
+            except Exception as e:
+                print("AUDIO: cue {} failed: {}".format(cue, e))
+
+
+class muted_audio:
+    """stands in for an audio_worker where nothing should be heard (replays, benchmarks); no thread"""
+    def say(self, text, volume=1):
+        pass
+
+    def play(self, sound_name, volume=1):
+        pass
+
+    def prerender(self, phrases, volume=1):
+        pass
+
+    def stop(self):
+        pass
+
+
+# one worker for the whole process, shared by every backend instance
+shared_worker = None
+shared_worker_lock = threading.Lock()
+
+def get_audio_worker(applause_sound_location=None, ding_sound_location=None):
+    global shared_worker
+    with shared_worker_lock:
+        if shared_worker is None:
+            backend = make_audio_backend()
+            tts = None
+            engine = make_tts_engine()
+            if (engine is not None) and (not isinstance(backend, null_audio_backend)):
+                try:
+                    tts = phrase_cache(engine, PM_config.tts_cache_location, PM_config.tts_cache_size)
+                except OSError as e:
+                    print("AUDIO: tts cache unavailable: {}".format(e))
+            shared_worker = audio_worker(
+                backend,
+                sounds={
+                    'applause': applause_sound_location or PM_config.applause_sound_location,
+                    'ding': ding_sound_location or PM_config.ding_sound_location},
+                queue_size=PM_config.audio_queue_size,
+                max_delay=PM_config.audio_max_cue_delay,
+                tts=tts)
+        return shared_worker
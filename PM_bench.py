@@ -0,0 +1,278 @@
+"""
+benchmarks for the session engine (prodman_backend), printed as json so that runs can be diffed:
+
+    python PM_bench.py [--ticks N] [--inputs N] [--pauses N] [--sessions N] [--output results.json] [--check]
+
+tick            cost of one pass of the session loop: advance + publish, the totals path, and print_stats
+input_latency   set_input_from_dash -> state change published / session thread awake and acting on it
+wakeups         session thread wakeups per minute while running, paused and waiting on a hassler, with and without
+                terminal output (simulated clock)
+timeline_memory memory growth per timeline block, between sessions of 3 lengths with many pauses (simulated clock)
+scheduler       many short sessions multiplexed on one PM_scheduler: cpu per step, and how late deadlines are served
+checks          pass / fail of the engine's properties (an idle session does not wake, memory per block is steady);
+                --check exits with status 1 if one fails
+"""
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import threading
+import contextlib
+from statistics import mean, median
+
+import PM_config
+from PM_audio import muted_audio
+from PM_backend import prodman_backend, PAUSED, RUNNING
+from PM_replay import replay
+from PM_scheduler import session_scheduler
+
+# one long block, so nothing but the benchmark's own inputs changes the state
+LONG_SCHEDULE = [{'task': 'work', 'length': 600, 'hassler': False, 'applause': True, 'dinger': 5, 'focus': 'bench', 'notes': ''}]
+
+
+class instrumented_backend(prodman_backend):
+    """counts and timestamps every pass of the session loop, and how late it came for the deadline it was due at"""
+    def __init__(self, *args, **kwargs):
+        self.wakeups = []
+        self.lateness = []
+        self.last_deadline_ns = None
+        self.woke = threading.Event()
+        super().__init__(*args, **kwargs)
+
+    def step(self):
+        version, phase, deadline_ns = super().step()
+        self.last_deadline_ns = deadline_ns
+        return version, phase, deadline_ns
+
+    def advance(self, now_ns):
+        self.wakeups.append(now_ns)
+        if (self.last_deadline_ns is not None) and (now_ns >= self.last_deadline_ns):
+            self.lateness.append(now_ns - self.last_deadline_ns)
+        super().advance(now_ns)
+        self.woke.set()
+
+
+def make_backend(backend_class=prodman_backend):
+    wt = backend_class(PM_config.applause_sound_location, PM_config.ding_sound_location, audio=muted_audio())
+    wt.console_output = False
+    wt.set_schedule([dict(block) for block in LONG_SCHEDULE])
+    return wt
+
+def percentiles(samples_ns):
+    samples_ns = sorted(samples_ns)
+    return {
+        'mean_us': round(mean(samples_ns)/1000, 3),
+        'p50_us': round(median(samples_ns)/1000, 3),
+        'p99_us': round(samples_ns[min(int(len(samples_ns)*0.99), len(samples_ns)-1)]/1000, 3),
+        'max_us': round(samples_ns[-1]/1000, 3),
+        'n': len(samples_ns),
+        }
+
+@contextlib.contextmanager
+def silenced_stdout():
+    # fd 1 itself is redirected too, in case anything writes to the terminal without going through sys.stdout
+    sys.stdout.flush()
+    saved_fd = os.dup(1)
+    with open(os.devnull, 'w') as devnull:
+        os.dup2(devnull.fileno(), 1)
+        try:
+            with contextlib.redirect_stdout(devnull):
+                yield
+        finally:
+            sys.stdout.flush()
+            os.dup2(saved_fd, 1)
+            os.close(saved_fd)
+
+
+def bench_tick(ticks):
+    wt = make_backend()
+    with wt.state_condition:
+        wt.begin_session(wt.now_ns())
+        wt.take_effects()
+        wt.publish_if_dirty()
+
+    def step():
+        with wt.state_condition:
+            wt.advance(wt.now_ns())
+            wt.run_effects(wt.take_effects())
+            wt.publish_if_dirty()
+
+    results = {}
+    parts = [
+        ('advance', step),
+        ('totals', lambda: wt.return_totals_and_goals_string()),
+        ('print_stats', wt.print_stats),
+        ]
+    with silenced_stdout():
+        for name, part in parts:
+            wall, cpu_started = [], time.process_time_ns()
+            for _ in range(ticks):
+                started = time.perf_counter_ns()
+                part()
+                wall.append(time.perf_counter_ns() - started)
+            results[name] = dict(percentiles(wall), cpu_mean_us=round((time.process_time_ns()-cpu_started)/ticks/1000, 3))
+    results['tick_mean_us'] = round(sum(results[name]['mean_us'] for name, _ in parts), 3)
+    return results
+
+
+def bench_input_latency(inputs):
+    wt = make_backend(instrumented_backend)
+    wt.refresh_interval = None
+    runner = threading.Thread(target=wt.start, daemon=True)
+    runner.start()
+    while wt.snapshot.phase != RUNNING:
+        time.sleep(0.001)
+
+    published, awake = [], []
+    for j in range(inputs):
+        command, expected = ('pause', PAUSED) if j%2==0 else ('unpause', RUNNING)
+        wt.woke.wait(1)
+        wt.woke.clear()
+        started = time.perf_counter_ns()
+        wt.set_input_from_dash(command)
+        if wt.snapshot.phase == expected:
+            published.append(time.perf_counter_ns() - started)
+        if wt.woke.wait(1):
+            awake.append(time.perf_counter_ns() - started)
+    wt.set_input_from_dash('finish')
+    runner.join(1)
+    return {'published': percentiles(published), 'session_thread_awake': percentiles(awake)}
+
+
+def bench_wakeups():
+    minutes = 60
+    scenarios = {
+        # (inputs, hassler)
+        'running': ([], False),
+        'paused': ([(0, 'pause')], False),
+        'hassler': ([], True),
+        }
+    # the stats refresh (engine_refresh_interval) only wakes a session that prints its stats to the terminal
+    results = {}
+    for console_name, console_output in [('console_off', False), ('console_on', True)]:
+        for name, (inputs, hassler) in scenarios.items():
+            schedule = [dict(LONG_SCHEDULE[0], hassler=hassler)]
+            with silenced_stdout():
+                wt = replay(schedule, inputs, limit_minutes=minutes, console_output=console_output,
+                    refresh_interval=PM_config.engine_refresh_interval, backend_class=instrumented_backend)
+            results['{}_{}'.format(name, console_name)] = round(len(wt.wakeups)/minutes, 3)
+    return results
+
+
+def timeline_bytes(timeline):
+    """bytes held by a session_timeline: its arrays (whole capacity) and its symbol table"""
+    arrays = sum(getattr(timeline, name).nbytes for name in ['starts', 'ends', 'lengths', 'tasks', 'foci', 'notes'])
+    symbols = timeline.symbols
+    strings = sum(sys.getsizeof(name) for name in symbols.names)
+    return arrays + sys.getsizeof(symbols.names) + sys.getsizeof(symbols.ids) + strings
+
+
+def timeline_memory(pauses):
+    """(timeline blocks, timeline bytes) after replaying a session with `pauses` pauses"""
+    schedule = [dict(LONG_SCHEDULE[0], length=pauses*2)]
+    inputs = []
+    for j in range(pauses):
+        inputs += [(2*j + 0.5, 'pause'), (2*j + 1, 'unpause')]
+    wt = replay(schedule, inputs)
+    return len(wt.timeline), timeline_bytes(wt.timeline)
+
+
+def bench_timeline_memory(pauses):
+    # only what the timeline itself holds is counted: the rest of a replay (backend, schedule, audio, bounded event /
+    # effect buffers) is a fixed cost that would make a per block figure depend on the session length. the symbol table
+    # is fixed too, so the cost per block is the growth between sessions of different lengths. the lengths are 4x
+    # apart, so the arrays (which double when full) are equally full at each, and the growth per block should come out
+    # the same between each pair.
+    pauses = max(pauses//16, 1)*16
+    (short_blocks, short_bytes), (mid_blocks, mid_bytes), (long_blocks, long_bytes) = [timeline_memory(n) for n in [pauses//16, pauses//4, pauses]]
+    return {
+        'timeline_blocks': [short_blocks, mid_blocks, long_blocks],
+        'timeline_bytes': [short_bytes, mid_bytes, long_bytes],
+        'bytes_per_block': round((long_bytes - short_bytes)/(long_blocks - short_blocks), 1),
+        'bytes_per_block_short': round((mid_bytes - short_bytes)/(mid_blocks - short_blocks), 1),
+        'bytes_per_block_long': round((long_bytes - mid_bytes)/(long_blocks - mid_blocks), 1),
+        }
+
+
+def bench_scheduler(sessions):
+    # blocks of a second or two with a ding every quarter second, so every session has a deadline in flight
+    schedule = [
+        {'task': 'work', 'length': 0.03, 'dinger': 0.004, 'applause': True},
+        {'task': 'break', 'length': 0.02, 'dinger': None},
+        ]
+    backends = []
+    for _ in range(sessions):
+        wt = instrumented_backend(PM_config.applause_sound_location, PM_config.ding_sound_location, audio=muted_audio())
+        wt.console_output = False
+        wt.set_schedule([dict(block) for block in schedule])
+        backends.append(wt)
+
+    scheduler = session_scheduler()
+    wall_started, cpu_started = time.perf_counter(), time.process_time()
+    for wt in backends:
+        scheduler.add(wt)
+    while len(scheduler)>0:
+        time.sleep(0.05)
+    wall, cpu = time.perf_counter()-wall_started, time.process_time()-cpu_started
+    scheduler.stop()
+
+    steps = sum(len(wt.wakeups) for wt in backends)
+    return {
+        'sessions': sessions,
+        'steps': steps,
+        'wall_seconds': round(wall, 3),
+        'cpu_seconds': round(cpu, 3),
+        'cpu_us_per_step': round(cpu/steps*10**6, 3),
+        'lateness': percentiles([late for wt in backends for late in wt.lateness]),
+        }
+
+
+def check(results):
+    """name -> passed, for the properties the engine is meant to have (not how fast this machine is)"""
+    wakeups = results['wakeups_per_minute']
+    memory = results['timeline_memory']
+    return {
+        # a paused session without terminal output waits for its next input and nothing else
+        'paused_console_off_idle': wakeups['paused_console_off'] < 0.1,
+        # the timeline costs the same per block however long the session is
+        'timeline_memory_per_block_steady': abs(memory['bytes_per_block_long'] - memory['bytes_per_block_short']) <= 0.2*memory['bytes_per_block'],
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='session engine benchmarks')
+    parser.add_argument('--ticks', type=int, default=2000)
+    parser.add_argument('--inputs', type=int, default=200)
+    parser.add_argument('--pauses', type=int, default=5000)
+    parser.add_argument('--sessions', type=int, default=2000)
+    parser.add_argument('--output', default=None, help='write the json here instead of stdout')
+    parser.add_argument('--check', action='store_true', help='exit with status 1 if any of the checks fails')
+    args = parser.parse_args()
+
+    results = {
+        'environment': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'engine_refresh_interval': PM_config.engine_refresh_interval,
+            },
+        'tick': bench_tick(args.ticks),
+        'input_latency': bench_input_latency(args.inputs),
+        'wakeups_per_minute': bench_wakeups(),
+        'timeline_memory': bench_timeline_memory(args.pauses),
+        'scheduler': bench_scheduler(args.sessions),
+        }
+    results['checks'] = check(results)
+    output = json.dumps(results, indent=2, sort_keys=True)
+    if args.output is None:
+        print(output)
+    else:
+        with open(args.output, 'w') as f:
+            f.write(output+'\n')
+    if args.check and (not all(results['checks'].values())):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -2,6 +2,10 @@
 # sound:
 applause_sound_location='/Users/user/Documents/PYTHON_PROJECTS/PM_local/applaud.aiff'
 ding_sound_location='/Users/user/Documents/PYTHON_PROJECTS/PM_local/ding.wav'
+# rendered voice prompts (see tts_engine below):
+tts_cache_location='/Users/user/Documents/PYTHON_PROJECTS/PM_local/tts_cache'
+# running sessions' journals, one per client, replayed on restart (see PM_journal); None disables journaling:
+journal_location='/Users/user/Documents/PYTHON_PROJECTS/PM_local/journal'
 
 # database:
 database_location = '"/Users/user/Documents/PRODUCTIVITY/PG_DATABASE"'
@@ -30,6 +34,67 @@ pg_local_port = '5430'
 pg_docker_port = '5432'
 postgres_container_name = 'prodman-pg'
 
+## DATABASE SETTINGS:
+pg_host = 'localhost'
+pg_user = 'postgres'
+pg_password = 'docker'
+pg_database = 'postgres'
+# PM_db keeps up to db_pool_size open connections (plus db_max_overflow more under load, closed when returned); a
+# query waits at most db_pool_timeout seconds for one. connections older than db_pool_recycle seconds are replaced.
+db_pool_size = 5
+db_max_overflow = 5
+db_pool_timeout = 10
+db_pool_recycle = 1800
+
+## ENGINE SETTINGS:
+# the session thread sleeps until the next block end / ding / user input.
+# with console_output on, engine_refresh_interval (seconds) additionally wakes it to refresh the stats printed in the
+# terminal; None disables that. without console output there is nothing to refresh, so a paused or idle session only
+# wakes for its own deadlines (hassler prompts) and inputs.
+engine_refresh_interval = 1
+# status and announcements in the terminal running the session; False for headless / dash-only runs. this holds for
+# sessions on PM_scheduler too (the dash app), which all print to the one terminal the app runs in.
+console_output = True
+# while a hassler block waits for 'okay', the prompt is repeated: first after hassler_nag_interval seconds, and each
+# following gap is hassler_nag_backoff times longer than the previous one, up to hassler_nag_max_interval seconds.
+hassler_nag_interval = 2.5
+hassler_nag_backoff = 1.5
+hassler_nag_max_interval = 60
+# PM_scheduler: many sessions share one timer thread (a timer wheel of scheduler_slots ticks of scheduler_resolution
+# seconds) and scheduler_workers threads that step them.
+scheduler_resolution = 0.01
+scheduler_slots = 4096
+scheduler_workers = 1
+# session journals are written out (and fsynced) in batches every journal_flush_interval seconds; a crash loses at
+# most the inputs of the last interval.
+journal_flush_interval = 1
+
+## AUDIO SETTINGS:
+# 'auto' picks 'macos' (say / afplay) or 'linux' (espeak / aplay) from the platform, 'null' mutes everything.
+audio_backend = 'auto'
+# cues are played one at a time by a single audio thread. at most audio_queue_size cues wait (the oldest is dropped),
+# and a cue that waited more than audio_max_cue_delay seconds is skipped.
+audio_queue_size = 8
+audio_max_cue_delay = 5
+# voice prompts are rendered once by tts_engine ('auto', 'espeak', 'say', or None to speak every prompt live),
+# cached as sound files in tts_cache_location and replayed from there. the tts_cache_size most recently used are kept.
+tts_engine = 'auto'
+tts_cache_size = 256
+
 ## DASH SETTINGS:
 dash_app_port = 8080
+# every browser gets its own session, told apart by this cookie. a session nobody has looked at for
+# session_idle_timeout seconds is dropped once it is not running (checked every session_sweep_interval seconds).
+client_cookie_name = 'prodman_client'
+session_idle_timeout = 6*3600
+session_sweep_interval = 60
+# the tracker's clock runs in the browser; it only asks the server for the session state when the session pushes a
+# change (see event_history below), after a button press, and every tracker_resync_interval seconds while the
+# browser has no event stream. the totals tables, which grow while a block is open, are also refreshed on the charts
+# interval.
+tracker_resync_interval = 15
+# session changes are pushed to the tracker over server-sent events (/events): the last event_history events are kept
+# for browsers that reconnect, and an idle stream gets a keepalive every event_keepalive seconds.
+event_history = 256
+event_keepalive = 15
 
@@ -0,0 +1,393 @@
+import json
+import atexit
+import datetime
+import threading
+from itertools import groupby
+from sqlalchemy import create_engine, text, table, column, tuple_, bindparam
+
+import PM_config
+
+
+#### SHARED ENGINE
+# one pooled engine per process, built from PM_config on first use. every database function borrows a connection
+# from it (connect / transaction) instead of creating an engine of its own, so only the first query of the process
+# pays for connection setup. pre-ping replaces connections that died with the postgres container.
+
+engine = None
+engine_lock = threading.Lock()
+
+
+def database_url():
+    return 'postgresql://{}:{}@{}:{}/{}'.format(
+        PM_config.pg_user,
+        PM_config.pg_password,
+        PM_config.pg_host,
+        PM_config.pg_local_port,
+        PM_config.pg_database)
+
+
+def get_engine():
+    global engine
+    with engine_lock:
+        if engine is None:
+            engine = create_engine(database_url(),
+                pool_size=PM_config.db_pool_size,
+                max_overflow=PM_config.db_max_overflow,
+                pool_timeout=PM_config.db_pool_timeout,
+                pool_recycle=PM_config.db_pool_recycle,
+                pool_pre_ping=True)
+        return engine
+
+
+def connect():
+    """a pooled connection; use as a context manager so it goes back to the pool"""
+    return get_engine().connect()
+
+
+def transaction():
+    """a pooled connection inside a transaction, committed when the with block exits (rolled back on error)"""
+    return get_engine().begin()
+
+
+def dispose():
+    """closes the pooled connections. the next query builds a fresh engine"""
+    global engine
+    with engine_lock:
+        if engine is not None:
+            engine.dispose()
+            engine = None
+
+atexit.register(dispose)
+
+
+#### QUERIES
+# every statement is built once with bound parameters, so names may contain any character and the compiled form is
+# cached and reused. multi-row writes go out as one executemany, multi-row deletes as one set-based statement.
+
+select_history_statement = text("""
+    SELECT * FROM public.history WHERE session_date BETWEEN :start_date AND :end_date
+""")
+
+last_session_id_statement = text("""
+    SELECT session_id
+    FROM public.history
+    WHERE session_date = :session_date
+    ORDER BY session_id DESC
+    LIMIT 1
+""")
+
+select_sessions_statement = text("""
+    SELECT * FROM public.history WHERE (session_date, session_id) IN :session_keys
+""").bindparams(bindparam('session_keys', expanding=True))
+
+insert_history_statement = text("""
+    INSERT INTO public.history (session_date, session_id, session_name, timeline, schedule)
+    VALUES (:session_date, :session_id, :session_name, :timeline, :schedule)
+""")
+
+select_templates_statement = text("""
+    SELECT * FROM public.templates
+""")
+
+insert_template_statement = text("""
+    INSERT INTO public.templates (template_id, template)
+    VALUES (:template_id, :template)
+""")
+
+delete_template_statement = text("""
+    DELETE FROM public.templates WHERE template_id = :template_id
+""")
+
+# (session_date, session_id) IN (...), expanded to however many sessions are passed
+history_table = table('history', column('session_date'), column('session_id'), schema='public')
+delete_history_statement = history_table.delete().where(
+    tuple_(history_table.c.session_date, history_table.c.session_id).in_(bindparam('session_keys', expanding=True)))
+
+
+#### HISTORY BLOCKS
+# public.history keeps each session's timeline and schedule as json. history_blocks has the same blocks one row each
+# (kind 'timeline' for what was done, 'schedule' for what was planned), so totals over any range of sessions are
+# computed by postgres from the indexes instead of by parsing the json of every session in python.
+# planned blocks have no start / end. lengths are in minutes, as in the json.
+
+create_history_blocks_statement = text("""
+    CREATE TABLE IF NOT EXISTS public.history_blocks (
+        session_date text,
+        session_id numeric,
+        kind text,
+        block_index integer,
+        task text,
+        focus text,
+        block_start timestamp,
+        block_end timestamp,
+        length double precision);
+    CREATE INDEX IF NOT EXISTS history_blocks_task_focus_start ON public.history_blocks(task, focus, block_start);
+    CREATE INDEX IF NOT EXISTS history_blocks_kind_start ON public.history_blocks(kind, block_start);
+    CREATE INDEX IF NOT EXISTS history_blocks_session ON public.history_blocks(session_date, session_id)
+""")
+
+insert_history_block_statement = text("""
+    INSERT INTO public.history_blocks (session_date, session_id, kind, block_index, task, focus, block_start, block_end, length)
+    VALUES (:session_date, :session_id, :kind, :block_index, :task, :focus, :block_start, :block_end, :length)
+""")
+
+history_blocks_table = table('history_blocks', column('session_date'), column('session_id'), schema='public')
+delete_history_blocks_statement = history_blocks_table.delete().where(
+    tuple_(history_blocks_table.c.session_date, history_blocks_table.c.session_id).in_(bindparam('session_keys', expanding=True)))
+
+# sessions recorded before history_blocks existed
+select_history_without_blocks_statement = text("""
+    SELECT * FROM public.history
+    WHERE NOT EXISTS (
+        SELECT 1 FROM public.history_blocks
+        WHERE history_blocks.session_date = history.session_date AND history_blocks.session_id = history.session_id)
+    ORDER BY session_date, session_id
+""")
+
+focus_minutes_statement = text("""
+    SELECT task, focus, sum(length) AS minutes
+    FROM public.history_blocks
+    WHERE kind = 'timeline' AND block_start >= :start AND block_start < :end
+    GROUP BY task, focus
+    ORDER BY task, focus
+""")
+
+task_focus_minutes_statement = text("""
+    SELECT sum(length) AS minutes
+    FROM public.history_blocks
+    WHERE kind = 'timeline' AND task = :task AND focus = :focus AND block_start >= :start AND block_start < :end
+""")
+
+
+#### HISTORY SUMMARIES
+# minutes done (actual) and planned (goal) per task of every recorded session, plus 'total' and 'total*', written
+# when the session is recorded. the history listing reads these instead of summing every session's json.
+
+create_history_summaries_statement = text("""
+    CREATE TABLE IF NOT EXISTS public.history_summaries (
+        session_date text,
+        session_id numeric,
+        session_name text,
+        task text,
+        actual double precision,
+        goal double precision);
+    CREATE INDEX IF NOT EXISTS history_summaries_session ON public.history_summaries(session_date, session_id)
+""")
+
+insert_history_summary_statement = text("""
+    INSERT INTO public.history_summaries (session_date, session_id, session_name, task, actual, goal)
+    VALUES (:session_date, :session_id, :session_name, :task, :actual, :goal)
+""")
+
+select_history_summaries_statement = text("""
+    SELECT session_date, session_id, session_name, task, actual, goal
+    FROM public.history_summaries
+    WHERE session_date BETWEEN :start_date AND :end_date
+    ORDER BY session_date, session_id
+""")
+
+history_summaries_table = table('history_summaries', column('session_date'), column('session_id'), schema='public')
+delete_history_summaries_statement = history_summaries_table.delete().where(
+    tuple_(history_summaries_table.c.session_date, history_summaries_table.c.session_id).in_(bindparam('session_keys', expanding=True)))
+
+delete_all_history_summaries_statement = text("""
+    DELETE FROM public.history_summaries
+""")
+
+select_history_without_summaries_statement = text("""
+    SELECT * FROM public.history
+    WHERE NOT EXISTS (
+        SELECT 1 FROM public.history_summaries
+        WHERE history_summaries.session_date = history.session_date AND history_summaries.session_id = history.session_id)
+    ORDER BY session_date, session_id
+""")
+
+# sessions between the dates recorded before history_summaries existed (and not yet backfilled)
+select_history_without_summaries_between_statement = text("""
+    SELECT * FROM public.history
+    WHERE session_date BETWEEN :start_date AND :end_date AND NOT EXISTS (
+        SELECT 1 FROM public.history_summaries
+        WHERE history_summaries.session_date = history.session_date AND history_summaries.session_id = history.session_id)
+""")
+
+
+#### TABLE CREATION
+# history_blocks and history_summaries came after public.history, so a database initialized before them lacks
+# them until it is migrated. they are created (if missing) on startup and before the first write that needs them.
+
+tables_ready = False
+
+def ensure_tables():
+    global tables_ready
+    if tables_ready:
+        return
+    with transaction() as connection:
+        connection.execute(create_history_blocks_statement)
+        connection.execute(create_history_summaries_statement)
+    tables_ready = True
+
+
+def select_history(start_date, end_date):
+    with connect() as connection:
+        return list(connection.execute(select_history_statement, {'start_date': start_date, 'end_date': end_date}))
+
+
+def select_sessions(session_keys):
+    """the full rows (timeline and schedule included) of the (session_date, session_id) sessions"""
+    session_keys = [(session_date, session_id) for session_date, session_id in session_keys]
+    if len(session_keys) == 0:
+        return []
+    with connect() as connection:
+        return list(connection.execute(select_sessions_statement, {'session_keys': session_keys}))
+
+
+def next_session_id(connection, session_date):
+    """the id the next session recorded on session_date gets (0 for the first one)"""
+    last_id = connection.execute(last_session_id_statement, {'session_date': session_date}).scalar()
+    if last_id is None:
+        return 0
+    return int(last_id+1)
+
+
+def insert_history(connection, session_date, session_id, session_name, timeline, schedule):
+    """inserts the session, its history_blocks rows and its history_summaries rows"""
+    connection.execute(insert_history_statement, {
+        'session_date': session_date,
+        'session_id': session_id,
+        'session_name': session_name,
+        'timeline': json.dumps(timeline),
+        'schedule': json.dumps(schedule),
+        })
+    insert_history_blocks(connection, session_date, session_id, timeline, schedule)
+    insert_history_summary(connection, session_date, session_id, session_name, timeline, schedule)
+
+
+def history_block_rows(session_date, session_id, timeline, schedule):
+    """history_blocks rows of one session, from its timeline and schedule (as stored in public.history)"""
+    rows = []
+    for kind, blocks in [('timeline', timeline), ('schedule', schedule)]:
+        for block_index, block in enumerate(blocks):
+            rows.append({
+                'session_date': session_date,
+                'session_id': session_id,
+                'kind': kind,
+                'block_index': block_index,
+                'task': block['task'],
+                'focus': block.get('focus'),
+                'block_start': datetime.datetime.fromisoformat(block['start']) if 'start' in block else None,
+                'block_end': datetime.datetime.fromisoformat(block['end']) if 'end' in block else None,
+                'length': float(block['length']),
+                })
+    return rows
+
+
+def insert_history_blocks(connection, session_date, session_id, timeline, schedule):
+    rows = history_block_rows(session_date, session_id, timeline, schedule)
+    if len(rows) > 0:
+        connection.execute(insert_history_block_statement, rows)
+
+
+def delete_history(session_keys):
+    """deletes the (session_date, session_id) sessions, and their history_blocks and history_summaries rows, in one statement each"""
+    session_keys = [(session_date, session_id) for session_date, session_id in session_keys]
+    if len(session_keys) == 0:
+        return
+    with transaction() as connection:
+        connection.execute(delete_history_statement, {'session_keys': session_keys})
+        connection.execute(delete_history_blocks_statement, {'session_keys': session_keys})
+        connection.execute(delete_history_summaries_statement, {'session_keys': session_keys})
+
+
+def focus_minutes(start, end):
+    """(task, focus, minutes) done on each task / focus in blocks that started in [start, end)"""
+    with connect() as connection:
+        return list(connection.execute(focus_minutes_statement, {'start': start, 'end': end}))
+
+
+def task_focus_minutes(task, focus, start, end):
+    """minutes done on one task / focus in blocks that started in [start, end)"""
+    with connect() as connection:
+        minutes = connection.execute(task_focus_minutes_statement, {'task': task, 'focus': focus, 'start': start, 'end': end}).scalar()
+    if minutes is None:
+        return 0
+    return minutes
+
+
+
+def session_totals(timeline, schedule):
+    """
+    (actual, goal): task -> minutes done / planned in the session, plus 'total' and 'total*' (which leaves out
+    pause and hassler from actual; goal 'total*' is goal 'total')
+    """
+    actual = {}
+    for block in timeline:
+        actual[block['task']] = actual.get(block['task'], 0) + float(block['length'])
+    goal = {}
+    for block in schedule:
+        goal[block['task']] = goal.get(block['task'], 0) + float(block['length'])
+    actual['total*'] = sum(v for k,v in actual.items() if k not in ['pause', 'hassler'])
+    actual['total'] = sum(v for k,v in actual.items() if k != 'total*')
+    goal['total'] = sum(goal.values())
+    goal['total*'] = goal['total']
+    return actual, goal
+
+
+def insert_history_summary(connection, session_date, session_id, session_name, timeline, schedule):
+    actual, goal = session_totals(timeline, schedule)
+    rows = [{
+        'session_date': session_date,
+        'session_id': session_id,
+        'session_name': session_name,
+        'task': task,
+        'actual': actual.get(task, 0),
+        'goal': goal.get(task, 0),
+        } for task in list(actual)+[task for task in goal if task not in actual]]
+    connection.execute(insert_history_summary_statement, rows)
+
+
+def history_totals(start_date, end_date):
+    """
+    (session_date, session_id, session_name, actual, goal) of the sessions between the dates, in session order, with
+    actual / goal as in session_totals. read from history_summaries; sessions without a summary yet fall back to
+    their json in public.history.
+    """
+    params = {'start_date': start_date, 'end_date': end_date}
+    ensure_tables()
+    with connect() as connection:
+        summary_rows = list(connection.execute(select_history_summaries_statement, params))
+        unsummarized = list(connection.execute(select_history_without_summaries_between_statement, params))
+    output = []
+    for session_key, rows in groupby(summary_rows, key=lambda row: tuple(row[:3])):
+        actual = {}
+        goal = {}
+        for row in rows:
+            actual[row['task']] = row['actual']
+            goal[row['task']] = row['goal']
+        output.append(session_key+(actual, goal))
+    for session in unsummarized:
+        timeline, schedule = session['timeline'], session['schedule']
+        if isinstance(timeline, str): timeline = json.loads(timeline)
+        if isinstance(schedule, str): schedule = json.loads(schedule)
+        output.append((session['session_date'], session['session_id'], session['session_name'])+session_totals(timeline, schedule))
+    if len(unsummarized) > 0:
+        output.sort(key=lambda session: (session[0], session[1]))
+    return output
+
+
+def select_templates():
+    with connect() as connection:
+        return list(connection.execute(select_templates_statement))
+
+
+def insert_templates(templates):
+    """inserts the (template_id, template) pairs in one round-trip"""
+    rows = [{'template_id': template_id, 'template': json.dumps(template)} for template_id, template in templates]
+    if len(rows) == 0:
+        return
+    with transaction() as connection:
+        connection.execute(insert_template_statement, rows)
+
+
+def delete_template(template_id):
+    with transaction() as connection:
+        connection.execute(delete_template_statement, {'template_id': template_id})
@@ -0,0 +1,47 @@
+import sys
+import json
+
+import PM_db
+from PM_backend import postgres_startup
+
+# fills public.history_blocks and public.history_summaries for the sessions recorded before they existed (sessions
+# that already have rows are left alone, so this can be run again at any time). one transaction per batch of sessions.
+# python3 PM_db_backfill.py --rebuild recomputes every session's summary from public.history.
+BATCH_SIZE = 100
+
+def parsed(session):
+    timeline, schedule = session['timeline'], session['schedule']
+    # json columns come back parsed, text ones (e.g. a hand-made copy of the table) do not
+    if isinstance(timeline, str): timeline = json.loads(timeline)
+    if isinstance(schedule, str): schedule = json.loads(schedule)
+    return timeline, schedule
+
+postgres_startup()
+
+with PM_db.transaction() as connection:
+    connection.execute(PM_db.create_history_blocks_statement)
+    connection.execute(PM_db.create_history_summaries_statement)
+    if '--rebuild' in sys.argv:
+        connection.execute(PM_db.delete_all_history_summaries_statement)
+
+with PM_db.connect() as connection:
+    sessions = list(connection.execute(PM_db.select_history_without_blocks_statement))
+
+for j in range(0, len(sessions), BATCH_SIZE):
+    with PM_db.transaction() as connection:
+        for session in sessions[j:j+BATCH_SIZE]:
+            timeline, schedule = parsed(session)
+            PM_db.insert_history_blocks(connection, session['session_date'], session['session_id'], timeline, schedule)
+    print("history_blocks: {} / {} sessions converted".format(min(j+BATCH_SIZE, len(sessions)), len(sessions)))
+
+with PM_db.connect() as connection:
+    sessions = list(connection.execute(PM_db.select_history_without_summaries_statement))
+
+for j in range(0, len(sessions), BATCH_SIZE):
+    with PM_db.transaction() as connection:
+        for session in sessions[j:j+BATCH_SIZE]:
+            timeline, schedule = parsed(session)
+            PM_db.insert_history_summary(connection, session['session_date'], session['session_id'], session['session_name'], timeline, schedule)
+    print("history_summaries: {} / {} sessions summarized".format(min(j+BATCH_SIZE, len(sessions)), len(sessions)))
+
+PM_db.dispose()
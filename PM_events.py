@@ -0,0 +1,59 @@
+import json
+import threading
+from collections import deque
+
+import PM_config
+
+
+class event_feed:
+    """
+    numbered log of a session's state changes (block started, paused, hassler on ...), for pushing to browsers.
+    only the last `size` events are kept: enough for a reconnecting browser to catch up on what it missed.
+    """
+    def __init__(self, size=None):
+        if size is None: size = PM_config.event_history
+        self.condition = threading.Condition()
+        self.events = deque(maxlen=size)    # (event id, kind, data)
+        self.last_id = 0
+        self.subscribers = 0                # open server_sent_events streams
+
+    def emit(self, kind, data):
+        with self.condition:
+            self.last_id += 1
+            self.events.append((self.last_id, kind, data))
+            self.condition.notify_all()
+
+    def since(self, last_id):
+        with self.condition:
+            return [event for event in self.events if event[0] > last_id]
+
+    def wait(self, last_id, timeout=None):
+        """the events after last_id, waiting up to timeout seconds for one if there are none yet"""
+        with self.condition:
+            self.condition.wait_for(lambda: self.last_id > last_id, timeout)
+        return self.since(last_id)
+
+
+def server_sent_events(feed, last_id=0, keepalive=None):
+    """
+    streams feed as text/event-stream, starting after last_id (a reconnecting browser sends its Last-Event-ID).
+    a comment line goes out every keepalive seconds without events, so proxies keep the connection open.
+    """
+    if keepalive is None: keepalive = PM_config.event_keepalive
+    with feed.condition:
+        feed.subscribers += 1
+    try:
+        # how long a browser waits before reconnecting
+        yield 'retry: 2000\n\n'
+        while True:
+            events = feed.wait(last_id, keepalive)
+            if len(events)==0:
+                yield ': keepalive\n\n'
+                continue
+            for event_id, kind, data in events:
+                yield 'id: {}\nevent: {}\ndata: {}\n\n'.format(event_id, kind, json.dumps(data))
+                last_id = event_id
+    finally:
+        # the browser went away (the server closes the generator)
+        with feed.condition:
+            feed.subscribers -= 1
@@ -0,0 +1,146 @@
+import os
+import json
+import threading
+from uuid import UUID
+
+import PM_config
+
+
+class session_journal:
+    """
+    append-only journal of one session, as json lines: a 'begin' record (schedule and wall-clock start) followed by
+    the inputs that changed the session, each stamped with its offset from the session start in monotonic ns.
+    together with the schedule these determine everything else (block ends, hasslers, dings happen at computed
+    deadlines), so replaying them through the state machine restores the session exactly.
+    append() only queues the line in memory; a shared journal_flusher thread writes and fsyncs queued lines in
+    batches, every flush_interval seconds, so a crash loses at most that much. delete() removes the journal (in the
+    same thread, so it cannot race a write) once the session no longer needs restoring.
+    """
+    def __init__(self, path, flusher=None):
+        self.path = path
+        self.flusher = flusher if flusher is not None else get_journal_flusher()
+        self.lock = threading.Lock()
+        self.pending = []
+        self.truncate = False
+        self.remove = False
+
+    def reset(self, record):
+        """starts the journal over with record (a new session)"""
+        with self.lock:
+            self.pending = [json.dumps(record)]
+            self.truncate = True
+            self.remove = False
+        self.flusher.mark(self)
+
+    def delete(self):
+        with self.lock:
+            self.pending = []
+            self.truncate = False
+            self.remove = True
+        self.flusher.mark(self)
+
+    def append(self, record):
+        with self.lock:
+            self.pending.append(json.dumps(record))
+        self.flusher.mark(self)
+
+    def flush(self):
+        with self.lock:
+            lines, self.pending = self.pending, []
+            truncate, self.truncate = self.truncate, False
+            remove, self.remove = self.remove, False
+        if remove:
+            if os.path.isfile(self.path):
+                os.remove(self.path)
+            return
+        if (len(lines)==0) and (not truncate):
+            return
+        with open(self.path, 'w' if truncate else 'a') as f:
+            if len(lines)>0:
+                f.write('\n'.join(lines)+'\n')
+            f.flush()
+            os.fsync(f.fileno())
+
+    def read(self):
+        return read_journal(self.path)
+
+
+def read_journal(path):
+    """the journal's records, up to a torn last line left by a crash ([] if there is no journal)"""
+    records = []
+    if not os.path.isfile(path):
+        return records
+    with open(path) as f:
+        for line in f:
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                break
+    return records
+
+
+class journal_flusher:
+    """one thread writing out every journal with queued records, every flush_interval seconds"""
+    def __init__(self, flush_interval):
+        self.flush_interval = flush_interval
+        self.condition = threading.Condition()
+        self.dirty = set()
+        self.thread = threading.Thread(name='journal-flusher', target=self.run, daemon=True)
+        self.thread.start()
+
+    def mark(self, journal):
+        with self.condition:
+            if len(self.dirty)==0:
+                self.condition.notify()
+            self.dirty.add(journal)
+
+    def flush_all(self):
+        with self.condition:
+            journals, self.dirty = self.dirty, set()
+        for journal in journals:
+            try:
+                journal.flush()
+            except OSError as e:
+                print("JOURNAL: could not write {}: {}".format(journal.path, e))
+
+    def run(self):
+        while True:
+            with self.condition:
+                self.condition.wait_for(lambda: len(self.dirty)>0)
+            # gather whatever else arrives within the interval into the same batch
+            with self.condition:
+                self.condition.wait(self.flush_interval)
+            self.flush_all()
+
+
+shared_flusher = None
+shared_flusher_lock = threading.Lock()
+
+def get_journal_flusher():
+    global shared_flusher
+    with shared_flusher_lock:
+        if shared_flusher is None:
+            shared_flusher = journal_flusher(PM_config.journal_flush_interval)
+        return shared_flusher
+
+def valid_client_id(client_id):
+    """True for the ids clients are given (uuid4().hex), so an id from a cookie cannot point outside journal_location"""
+    if (not isinstance(client_id, str)) or (len(client_id) != 32):
+        return False
+    try:
+        uuid = UUID(hex=client_id)
+    except ValueError:
+        return False
+    return (uuid.version == 4) and (uuid.hex == client_id)
+
+def journal_path(client_id):
+    if not valid_client_id(client_id):
+        raise ValueError("invalid client id: {!r}".format(client_id))
+    return os.path.join(PM_config.journal_location, '{}.journal'.format(client_id))
+
+def journaled_clients():
+    """ids of the clients with a journal in journal_location"""
+    if (PM_config.journal_location is None) or (not os.path.isdir(PM_config.journal_location)):
+        return []
+    client_ids = [name[:-len('.journal')] for name in sorted(os.listdir(PM_config.journal_location)) if name.endswith('.journal')]
+    return [client_id for client_id in client_ids if valid_client_id(client_id)]
@@ -0,0 +1,71 @@
+import sys
+
+#### ANSI ESCAPES
+CLEAR_SCREEN = '\033[2J\033[H'
+CLEAR_LINE = '\033[K'
+CLEAR_BELOW = '\033[J'
+
+def move_to(row):
+    # rows are 1-based on the terminal
+    return '\033[{};1H'.format(row+1)
+
+
+class terminal_renderer:
+    """
+    keeps a block of status lines at the top of the terminal up to date by writing ANSI escapes directly:
+    only the lines that changed since the last render are rewritten, in a single write.
+    anything else printed to the terminal (see invalidate) makes the next render repaint the whole screen.
+    """
+    def __init__(self, stream=None):
+        self.stream = stream
+        self.lines = None
+
+    def invalidate(self):
+        self.lines = None
+
+    def render(self, lines):
+        stream = self.stream if self.stream is not None else sys.stdout
+        if self.lines is None:
+            output = [CLEAR_SCREEN, '\n'.join(lines)]
+        else:
+            output = []
+            for row, line in enumerate(lines):
+                if (row >= len(self.lines)) or (self.lines[row] != line):
+                    output.append(move_to(row)+line+CLEAR_LINE)
+            if len(lines) < len(self.lines):
+                output.append(move_to(len(lines))+CLEAR_BELOW)
+            # park the cursor below the status block
+            output.append(move_to(len(lines)))
+        self.lines = list(lines)
+        # nothing changed: only the cursor move is queued
+        if len(output) > 1:
+            stream.write(''.join(output))
+            stream.flush()
+
+
+def table_lines(columns, rows, max_width=None):
+    """
+    lays out rows = [(row label, {column: value})] under the given column names, like a small DataFrame print.
+    columns that do not fit in max_width characters continue in another table below, as pandas does.
+    """
+    label_width = max([len(str(label)) for label, _ in rows]+[0])
+    widths = [max([len(str(column))]+[len(str(values.get(column, ''))) for _, values in rows]) for column in columns]
+
+    # split the columns into groups that fit
+    groups, group, used = [], [], label_width
+    for column, width in zip(columns, widths):
+        if (max_width is not None) and (len(group)>0) and (used+2+width > max_width):
+            groups.append(group)
+            group, used = [], label_width
+        group.append((column, width))
+        used += 2+width
+    groups.append(group)
+
+    lines = []
+    for j, group in enumerate(groups):
+        if j>0:
+            lines.append('')
+        lines.append(' '*label_width+''.join('  '+str(column).rjust(width) for column, width in group))
+        for label, values in rows:
+            lines.append(str(label).ljust(label_width)+''.join('  '+str(values.get(column, '')).rjust(width) for column, width in group))
+    return lines
@@ -0,0 +1,56 @@
+import copy
+import datetime
+from functools import partial
+
+import PM_config
+from PM_audio import muted_audio
+from PM_timing import simulated_clock, minutes_to_ns, NS_PER_MINUTE
+from PM_backend import prodman_backend
+
+
+def replay(schedule, inputs=(), start_wall=datetime.datetime(2020, 1, 1, 9), limit_minutes=None, audio=None, console_output=False,
+        refresh_interval=None, backend_class=prodman_backend):
+    """
+    runs schedule to completion on a simulated clock and returns the backend (timeline, totals, counts ...).
+    inputs are (minutes after the session started, command) pairs fed to set_input_from_dash at that simulated time,
+    e.g. [(3, 'pause'), (4.5, 'unpause'), (10, 'next'), (26, 'okay')].
+    a hassler nags until it gets an 'okay', so the session is finished after limit_minutes
+    (default: the planned length plus a day) in case the inputs never provide one.
+    """
+    clock = simulated_clock(start_wall=start_wall)
+    if audio is None: audio = muted_audio()
+    wt = backend_class(
+        applause_sound_location=PM_config.applause_sound_location,
+        ding_sound_location=PM_config.ding_sound_location,
+        audio=audio,
+        clock=clock)
+    wt.console_output = console_output
+    wt.refresh_interval = refresh_interval
+    wt.set_schedule(copy.deepcopy(schedule))
+
+    for minutes, command in inputs:
+        clock.call_at(clock.start_ns + minutes_to_ns(minutes), partial(wt.set_input_from_dash, command))
+    if limit_minutes is None:
+        limit_ns = wt.plan.total_length_ns + 24*60*NS_PER_MINUTE
+    else:
+        limit_ns = minutes_to_ns(limit_minutes)
+    clock.call_at(clock.start_ns + limit_ns, partial(wt.set_input_from_dash, 'finish'))
+
+    wt.start()
+    return wt
+
+
+if __name__ == "__main__":
+    import time
+
+    inputs = [(3, 'pause'), (4.5, 'unpause'), (20, 'next'), (42, 'okay'), (80, 'okay'), (120, 'okay')]
+    started = time.perf_counter()
+    wt = replay(PM_config.initial_schedule, inputs)
+    elapsed = time.perf_counter() - started
+
+    for block in wt.timeline_completed():
+        print("{start}  {task:<12} {length:8.2f} min".format(**block))
+    print("TOTALS:")
+    for task, total in wt.totals.items():
+        print("{:<12} {}".format(task, wt.timedelta_to_string(total)))
+    print("replayed in {:.1f} ms".format(elapsed*1000))
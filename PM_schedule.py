@@ -0,0 +1,135 @@
+import datetime
+from types import MappingProxyType
+from collections import namedtuple
+
+from PM_timing import minutes_to_ns, ns_to_timedelta
+
+# pseudo tasks the session adds to every schedule
+EXTRA_TASKS = ('pause', 'hassler')
+
+
+class planned_block(namedtuple('planned_block', [
+        'index',
+        'task',
+        'task_id',      # index into schedule_plan.tasks
+        'focus',
+        'notes',
+        'length_ns',
+        'offset_ns',    # planned start, counted from the start of the session (no pauses / hasslers)
+        'hassler',
+        'applause',
+        'dings_ns',     # running times within the block at which to ding (a range, so it costs O(1) to store)
+        ])):
+    __slots__ = ()
+
+    @property
+    def length(self):
+        return ns_to_timedelta(self.length_ns)
+
+
+class schedule_plan(namedtuple('schedule_plan', [
+        'blocks',
+        'tasks',        # schedule tasks in order of first appearance, then EXTRA_TASKS
+        'task_ids',
+        'goals_ns',     # task -> planned ns
+        'focus_goals_ns',   # (task, focus) -> planned ns
+        'totals_goal',  # task -> timedelta, plus 'total' and 'total*'
+        'total_length_ns',
+        'phrases',      # every prompt the session can say, in the order they are first needed
+        ])):
+    """
+    a schedule compiled once when it is set: the session engine only indexes into it afterwards.
+    """
+    __slots__ = ()
+
+    def __len__(self):
+        return len(self.blocks)
+
+
+def normalize_task(task):
+    return task.strip().lower()
+
+def valid_dinger(dinger):
+    return (dinger is not None) and (type(dinger) in [int, float]) and (dinger>0)
+
+def block_phrases(block):
+    phrases = []
+    if block.hassler:
+        phrases.append("type, okay, to start {}".format(block.task))
+    phrases.append("START {}!".format(block.task))
+    if (block.focus is not None) and (block.focus!=''):
+        phrases.append("FOCUS ON {}!".format(block.focus))
+    phrases.append("and returning to {}".format(block.task))
+    return phrases
+
+SESSION_PHRASES = ('next!', 'pausing current session!', 'unpausing', 'session completed!')
+
+
+def compile_schedule(schedule):
+    """
+    compiles a list of block dicts (task, length in minutes, hassler, applause, dinger, focus, notes) into a schedule_plan.
+    task names are normalized in place, since the schedule dicts are what gets recorded.
+    """
+    blocks = []
+    task_ids = {}
+    goals_ns = {}
+    focus_goals_ns = {}
+    phrases = {}
+    offset_ns = 0
+    for index, block in enumerate(schedule):
+        task = normalize_task(block['task'])
+        block['task'] = task
+        if task not in task_ids:
+            task_ids[task] = len(task_ids)
+        length_ns = minutes_to_ns(block['length'])
+        focus = block.get('focus')
+
+        dings_ns = range(0)
+        dinger = block.get('dinger')
+        if valid_dinger(dinger):
+            dinger_ns = minutes_to_ns(dinger)
+            dings_ns = range(dinger_ns, length_ns, dinger_ns)
+
+        planned = planned_block(
+            index=index,
+            task=task,
+            task_id=task_ids[task],
+            focus=focus,
+            notes=block.get('notes'),
+            length_ns=length_ns,
+            offset_ns=offset_ns,
+            hassler=block.get('hassler') == True,
+            applause=block.get('applause') == True,
+            dings_ns=dings_ns)
+        blocks.append(planned)
+
+        offset_ns += length_ns
+        goals_ns[task] = goals_ns.get(task, 0) + length_ns
+        focus_key = (task, focus if focus is not None else '')
+        focus_goals_ns[focus_key] = focus_goals_ns.get(focus_key, 0) + length_ns
+        for phrase in block_phrases(planned):
+            phrases[phrase] = None
+
+    for task in EXTRA_TASKS:
+        task_ids.setdefault(task, len(task_ids))
+        goals_ns.setdefault(task, 0)
+    for phrase in SESSION_PHRASES:
+        phrases[phrase] = None
+
+    # schedule tasks alphabetically, then pause / hassler
+    totals_goal = {task: ns_to_timedelta(goals_ns[task]) for task in sorted(goals_ns) if task not in EXTRA_TASKS}
+    totals_goal.update((task, datetime.timedelta()) for task in EXTRA_TASKS)
+    totals_goal['total'] = ns_to_timedelta(offset_ns)
+    totals_goal['total*'] = totals_goal['total']
+
+    return schedule_plan(
+        blocks=tuple(blocks),
+        tasks=tuple(task_ids),
+        task_ids=MappingProxyType(task_ids),
+        goals_ns=MappingProxyType(goals_ns),
+        focus_goals_ns=MappingProxyType(focus_goals_ns),
+        totals_goal=MappingProxyType(totals_goal),
+        total_length_ns=offset_ns,
+        phrases=tuple(phrases))
+
+EMPTY_PLAN = compile_schedule([])
@@ -0,0 +1,196 @@
+import threading
+from collections import deque
+
+import PM_config
+from PM_timing import system_clock, NS_PER_SECOND
+from PM_backend import COMPLETE
+
+
+class timer_wheel:
+    """
+    hashed timing wheel: a ring of slots, each covering resolution_ns. a deadline goes into the slot of the tick it
+    falls in (modulo the ring size), so adding, moving and cancelling a timer is O(1), and advancing by one tick
+    only looks at one slot. deadlines more than one revolution away stay in their slot and are skipped until due.
+    there is at most one timer per key.
+    not thread safe: session_scheduler serializes access.
+    """
+    def __init__(self, resolution_ns, slots, start_ns):
+        self.resolution_ns = resolution_ns
+        self.slots = [dict() for _ in range(slots)]
+        self.where = {}                             # key -> slot holding its timer
+        self.cursor = self.tick(start_ns)           # next tick to process
+
+    def tick(self, ns):
+        return -((-ns)//self.resolution_ns)         # ceiling: a deadline is handled by the tick ending at or after it
+
+    def __len__(self):
+        return len(self.where)
+
+    def __contains__(self, key):
+        return key in self.where
+
+    def add(self, key, deadline_ns):
+        """adds or moves key's timer. returns False (and adds nothing) if the deadline's tick was already processed"""
+        self.cancel(key)
+        tick = self.tick(deadline_ns)
+        if tick < self.cursor:
+            return False
+        index = tick % len(self.slots)
+        self.slots[index][key] = deadline_ns
+        self.where[key] = index
+        return True
+
+    def cancel(self, key):
+        index = self.where.pop(key, None)
+        if index is not None:
+            del self.slots[index][key]
+
+    def next_tick_ns(self):
+        """start of the next tick with a timer in its slot (None if there are no timers)"""
+        if len(self.where)==0:
+            return None
+        for tick in range(self.cursor, self.cursor+len(self.slots)):
+            if len(self.slots[tick % len(self.slots)])>0:
+                return tick*self.resolution_ns
+
+    def advance(self, now_ns):
+        """processes every tick up to now_ns and returns the keys whose deadline passed"""
+        due = []
+        if len(self.where)==0:
+            self.cursor = max(self.cursor, self.tick(now_ns))
+            return due
+        last = now_ns//self.resolution_ns
+        if last - self.cursor >= len(self.slots):
+            # fell more than a revolution behind: one pass over every slot covers it
+            ticks = range(len(self.slots))
+            limit_ns = now_ns
+        else:
+            ticks = range(self.cursor, last+1)
+            limit_ns = None
+        for tick in ticks:
+            slot = self.slots[tick % len(self.slots)]
+            if len(slot)==0:
+                continue
+            tick_limit_ns = limit_ns if limit_ns is not None else tick*self.resolution_ns
+            for key, deadline_ns in list(slot.items()):
+                if deadline_ns <= tick_limit_ns:
+                    del slot[key]
+                    del self.where[key]
+                    due.append(key)
+        self.cursor = max(self.cursor, last+1)
+        return due
+
+
+class session_scheduler:
+    """
+    drives many prodman_backend sessions on one timer thread and a few worker threads, instead of a thread per
+    session (prodman_backend.start). each session has at most one timer in a timer_wheel, set to the deadline its
+    last step() returned; input published from other threads wakes it through its waker hook.
+    cpu scales with timer expirations and inputs, memory with one wheel entry per session.
+    """
+    def __init__(self, resolution=None, slots=None, workers=None, clock=None):
+        if resolution is None: resolution = PM_config.scheduler_resolution
+        if slots is None: slots = PM_config.scheduler_slots
+        if workers is None: workers = PM_config.scheduler_workers
+        if clock is None: clock = system_clock()
+        self.clock = clock
+        # one lock; the timer thread and the workers wait on separate conditions so they do not wake each other
+        self.lock = threading.Lock()
+        self.timer_condition = threading.Condition(self.lock)
+        self.worker_condition = threading.Condition(self.lock)
+        self.wheel = timer_wheel(int(resolution*NS_PER_SECOND), slots, clock.monotonic_ns())
+        self.sessions = set()
+        self.ready = deque()
+        self.pending = set()    # sessions in self.ready
+        self.changed = False    # the wheel got a timer earlier than the timer thread's wakeup
+        self.timer_wake_ns = None
+        self.stopped = False
+
+        self.timer_thread = threading.Thread(name='scheduler-timers', target=self.run_timers, daemon=True)
+        self.worker_threads = [threading.Thread(name='scheduler-worker-{}'.format(j), target=self.run_worker, daemon=True) for j in range(workers)]
+        self.timer_thread.start()
+        for thread in self.worker_threads:
+            thread.start()
+
+    def __len__(self):
+        return len(self.sessions)
+
+    def add(self, session, resume=False):
+        """starts the session's deployed schedule (or resumes one under way) and drives it until it completes"""
+        # the session keeps its console_output / refresh_interval: run_worker prints its stats like start() would
+        session.waker = self.wake
+        if (not resume) and (not session.begin()):
+            return False
+        with self.lock:
+            self.sessions.add(session)
+            self.make_ready(session)
+        return True
+
+    def remove(self, session):
+        with self.lock:
+            self.sessions.discard(session)
+            self.wheel.cancel(session)
+        session.waker = None
+
+    def wake(self, session):
+        with self.lock:
+            if session in self.sessions:
+                self.make_ready(session)
+
+    def make_ready(self, session):
+        # holding self.lock
+        if session not in self.pending:
+            self.pending.add(session)
+            self.ready.append(session)
+            self.worker_condition.notify()
+
+    def schedule(self, session, version, deadline_ns):
+        with self.lock:
+            # a step that raced with a newer one (on another worker) must not overwrite the newer deadline
+            if (session not in self.sessions) or (version != session.version):
+                return
+            if deadline_ns is None:
+                self.wheel.cancel(session)
+            elif self.wheel.add(session, deadline_ns):
+                if (self.timer_wake_ns is None) or (deadline_ns < self.timer_wake_ns):
+                    self.changed = True
+                    self.timer_condition.notify()
+            else:
+                self.make_ready(session)
+
+    def stop(self):
+        with self.lock:
+            self.stopped = True
+            self.timer_condition.notify_all()
+            self.worker_condition.notify_all()
+        for thread in [self.timer_thread]+self.worker_threads:
+            thread.join()
+
+    def run_timers(self):
+        with self.lock:
+            while not self.stopped:
+                for session in self.wheel.advance(self.clock.monotonic_ns()):
+                    self.make_ready(session)
+                self.changed = False
+                # sleep through empty ticks, and until a timer is added if there are none
+                self.timer_wake_ns = self.wheel.next_tick_ns()
+                self.clock.wait_until(self.timer_condition, lambda: self.stopped or self.changed, self.timer_wake_ns)
+
+    def run_worker(self):
+        while True:
+            with self.lock:
+                self.worker_condition.wait_for(lambda: self.stopped or len(self.ready)>0)
+                if self.stopped:
+                    return
+                session = self.ready.popleft()
+                self.pending.discard(session)
+            version, phase, deadline_ns = session.step()
+            if phase == COMPLETE:
+                self.remove(session)
+                continue
+            if session.console_output:
+                session.print_stats()
+                # the wheel's timer doubles as the stats refresh
+                if session.refresh_interval is not None:
+                    deadline_ns = session.next_wakeup(deadline_ns, session.now_ns() + int(session.refresh_interval*NS_PER_SECOND))
+            self.schedule(session, version, deadline_ns)
@@ -0,0 +1,80 @@
+import time
+import threading
+
+import PM_config
+from PM_scheduler import session_scheduler
+
+
+class session_registry:
+    """
+    one backend per client id (a browser, the terminal ...), created on first use by factory(client_id).
+    a backend created with a journal holding a session (e.g. from before a restart) restores it, and a restored
+    session that is still under way is resumed on the scheduler.
+    every backend carries its own session and caches (templates, selected history), so clients never share state,
+    and the registry lock only guards the id -> backend map, so clients do not serialize on each other.
+    backends nobody asked for in idle_timeout seconds are evicted, unless their session is still running or a
+    browser is still streaming their events.
+    running sessions are all driven by one shared session_scheduler rather than a thread each.
+    """
+    def __init__(self, factory, idle_timeout=None, sweep_interval=None, clock=time.monotonic):
+        if idle_timeout is None: idle_timeout = PM_config.session_idle_timeout
+        if sweep_interval is None: sweep_interval = PM_config.session_sweep_interval
+        self.factory = factory
+        self.idle_timeout = idle_timeout
+        self.sweep_interval = sweep_interval
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.backends = {}      # client id -> backend
+        self.last_seen = {}     # client id -> clock() of the last get()
+        self.last_sweep = clock()
+        self.scheduler = None
+
+    def __len__(self):
+        return len(self.backends)
+
+    def get(self, client_id):
+        """the client's backend, created if needed; also evicts idle backends every sweep_interval seconds"""
+        now = self.clock()
+        created = False
+        with self.lock:
+            wt = self.backends.get(client_id)
+            if wt is None:
+                wt = self.backends[client_id] = self.factory(client_id)
+                created = True
+            self.last_seen[client_id] = now
+            if now - self.last_sweep >= self.sweep_interval:
+                self.sweep(now)
+        if created and (wt.journal is not None) and wt.restore_from_journal():
+            if not wt.session_complete:
+                self.start(wt, resume=True)
+        return wt
+
+    def restore(self, client_ids):
+        """creates (and so restores and resumes) the backends of client_ids, e.g. every journaled client on startup"""
+        for client_id in client_ids:
+            self.get(client_id)
+
+    def most_recent(self):
+        with self.lock:
+            if len(self.last_seen)==0:
+                return None
+            return self.backends[max(self.last_seen, key=self.last_seen.get)]
+
+    def sweep(self, now):
+        # holding self.lock
+        self.last_sweep = now
+        for client_id, seen in list(self.last_seen.items()):
+            wt = self.backends[client_id]
+            # a tab streaming the backend's events (see PM_events) sends no requests, but is still using it
+            if (now - seen >= self.idle_timeout) and wt.session_complete and (wt.feed.subscribers == 0):
+                if wt.journal is not None:
+                    wt.journal.delete()
+                del self.backends[client_id]
+                del self.last_seen[client_id]
+
+    def start(self, wt, resume=False):
+        """runs wt's deployed schedule on the shared scheduler (resume=True: the session is already under way)"""
+        with self.lock:
+            if self.scheduler is None:
+                self.scheduler = session_scheduler()
+        return self.scheduler.add(wt, resume)
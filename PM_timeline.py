@@ -0,0 +1,152 @@
+import numpy as np
+
+from PM_timing import ns_to_minutes
+
+
+class symbol_table:
+    """interns the strings of a timeline (tasks, foci, notes) as small ints. append-only, so ids never change"""
+    def __init__(self):
+        self.names = []
+        self.ids = {}
+
+    def intern(self, name):
+        symbol = self.ids.get(name)
+        if symbol is None:
+            symbol = self.ids[name] = len(self.names)
+            self.names.append(name)
+        return symbol
+
+
+class session_timeline:
+    """
+    the blocks of one session, as parallel numpy arrays: start / end / length in monotonic ns and interned
+    task / focus / notes ids. appending a block and closing the last one are O(1) (amortized: the arrays double
+    when full), and both only ever write past what existing views can see, so view() is an immutable snapshot
+    that copies nothing. a full array is replaced rather than grown in place, so older views keep theirs.
+    json rows (wall-clock times, minutes) are only formatted when asked for, from the arrays (timeline_view.rows).
+    """
+    def __init__(self, to_wall=None, capacity=64):
+        self.to_wall = to_wall
+        self.symbols = symbol_table()
+        self.starts = np.zeros(capacity, dtype=np.int64)
+        self.ends = np.zeros(capacity, dtype=np.int64)
+        self.lengths = np.zeros(capacity, dtype=np.int64)
+        self.tasks = np.zeros(capacity, dtype=np.int32)
+        self.foci = np.zeros(capacity, dtype=np.int32)
+        self.notes = np.zeros(capacity, dtype=np.int32)
+        self.count = 0
+        self.closed = 0
+
+    def __len__(self):
+        return self.count
+
+    @property
+    def is_open(self):
+        return self.closed < self.count
+
+    def grow(self):
+        capacity = 2*len(self.starts)
+        for name in ['starts', 'ends', 'lengths', 'tasks', 'foci', 'notes']:
+            old = getattr(self, name)
+            new = np.zeros(capacity, dtype=old.dtype)
+            new[:self.count] = old[:self.count]
+            setattr(self, name, new)
+
+    def append(self, start_ns, task, focus, notes):
+        if self.count == len(self.starts):
+            self.grow()
+        j = self.count
+        self.starts[j] = start_ns
+        self.tasks[j] = self.symbols.intern(task)
+        self.foci[j] = self.symbols.intern(focus)
+        self.notes[j] = self.symbols.intern(notes)
+        self.count += 1
+
+    def close(self, end_ns):
+        """closes the last block"""
+        j = self.closed
+        self.ends[j] = end_ns
+        self.lengths[j] = end_ns - self.starts[j]
+        self.closed += 1
+
+    def view(self):
+        return timeline_view(self, self.starts, self.lengths, self.tasks, self.foci, self.notes, self.count, self.closed)
+
+
+class timeline_view:
+    """
+    the timeline as it was when the view was taken; the open block (if any) is closed at the now_ns passed in.
+    """
+    __slots__ = ('timeline', 'starts', 'lengths', 'tasks', 'foci', 'notes', 'count', 'closed')
+
+    def __init__(self, timeline, starts, lengths, tasks, foci, notes, count, closed):
+        self.timeline = timeline
+        self.starts = starts
+        self.lengths = lengths
+        self.tasks = tasks
+        self.foci = foci
+        self.notes = notes
+        self.count = count
+        self.closed = closed
+
+    def __len__(self):
+        return self.count
+
+    def open_block_ns(self, now_ns):
+        """(index, length so far) of the open block, or (None, 0)"""
+        if self.closed == self.count:
+            return None, 0
+        return self.closed, now_ns - int(self.starts[self.closed])
+
+    def sums_ns(self, ids, now_ns):
+        """id -> ns spent on it, for one id per block (e.g. self.tasks)"""
+        if self.count == 0:
+            return {}
+        keys, inverse = np.unique(ids[:self.count], return_inverse=True)
+        sums = np.bincount(inverse[:self.closed], weights=self.lengths[:self.closed], minlength=len(keys))
+        output = {int(key): int(round(ns)) for key, ns in zip(keys, sums)}
+        index, open_ns = self.open_block_ns(now_ns)
+        if index is not None:
+            output[int(ids[index])] += open_ns
+        return output
+
+    def task_sums_ns(self, now_ns):
+        """task -> ns spent on it"""
+        names = self.timeline.symbols.names
+        return {names[task]: ns for task, ns in self.sums_ns(self.tasks, now_ns).items()}
+
+    def focus_sums_ns(self, now_ns):
+        """(task, focus) -> ns spent on it"""
+        names = self.timeline.symbols.names
+        # one id per (task, focus) pair
+        n = len(names)
+        pairs = self.tasks[:self.count].astype(np.int64)*n + self.foci[:self.count]
+        return {(names[pair//n], names[pair%n]): ns for pair, ns in self.sums_ns(pairs, now_ns).items()}
+
+    def rows(self, now_ns, start=0, stop=None):
+        """
+        json rows ('start' / 'end' as wall-clock strings, 'length' in minutes) of blocks start to stop (all by
+        default), the open one ending at now_ns. only the rows asked for are formatted.
+        """
+        if stop is None: stop = self.count
+        stop = min(stop, self.count)
+        if start >= stop:
+            return []
+        timeline = self.timeline
+        names = timeline.symbols.names
+        to_wall = timeline.to_wall
+        starts = self.starts[start:stop].tolist()
+        ends = (self.starts[start:stop] + self.lengths[start:stop]).tolist()
+        if stop > self.closed:
+            ends[-1] = now_ns
+        output = []
+        for start_ns, end_ns, task, focus, notes in zip(starts, ends, self.tasks[start:stop].tolist(), self.foci[start:stop].tolist(), self.notes[start:stop].tolist()):
+            output.append({
+                'start': str(to_wall(start_ns)),
+                'end': str(to_wall(end_ns)),
+                'task': names[task],
+                'focus': names[focus],
+                'notes': names[notes],
+                'length': ns_to_minutes(end_ns - start_ns),
+                })
+        return output
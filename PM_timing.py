@@ -0,0 +1,257 @@
+import time
+import heapq
+import datetime
+from types import MappingProxyType
+from collections import namedtuple
+from collections.abc import Mapping
+
+NS_PER_SECOND = 10**9
+NS_PER_MINUTE = 60*NS_PER_SECOND
+
+# 'total*' excludes these from its count
+TOTAL_STAR_EXCLUDED = ('pause', 'hassler')
+
+
+def minutes_to_ns(minutes):
+    return int(round(float(minutes)*NS_PER_MINUTE))
+
+def ns_to_timedelta(ns):
+    return datetime.timedelta(microseconds=ns//1000)
+
+def ns_to_minutes(ns):
+    return ns/NS_PER_MINUTE
+
+
+#### CLOCKS
+# a clock gives the session its monotonic ns readings and its wall-clock anchor, and does its waiting:
+# wait_until(condition, predicate, deadline_ns) waits on the (held) condition until predicate() or deadline_ns.
+
+class system_clock:
+    """real time"""
+    def monotonic_ns(self):
+        return time.monotonic_ns()
+
+    def now(self):
+        return datetime.datetime.now()
+
+    def wait_until(self, condition, predicate, deadline_ns=None):
+        timeout = None
+        if deadline_ns is not None:
+            timeout = max((deadline_ns - time.monotonic_ns())/NS_PER_SECOND, 0)
+        return condition.wait_for(predicate, timeout)
+
+
+class simulated_clock:
+    """
+    virtual time that only moves while the session waits: a wait jumps straight to its deadline, or to the next
+    callback scheduled with call_at (e.g. a scripted input) if that comes first and wakes the session.
+    a session runs as fast as the cpu allows, with exactly the same accounting as in real time.
+    """
+    def __init__(self, start_wall=datetime.datetime(2020, 1, 1, 9), start_ns=0):
+        self.start_wall = start_wall
+        self.start_ns = start_ns
+        self.ns = start_ns
+        self.callbacks = [] # heap of (at_ns, sequence, callback)
+        self.sequence = 0
+
+    def monotonic_ns(self):
+        return self.ns
+
+    def now(self):
+        return self.start_wall + ns_to_timedelta(self.ns - self.start_ns)
+
+    def call_at(self, at_ns, callback):
+        heapq.heappush(self.callbacks, (at_ns, self.sequence, callback))
+        self.sequence += 1
+
+    def wait_until(self, condition, predicate, deadline_ns=None):
+        while not predicate():
+            if (len(self.callbacks)>0) and ((deadline_ns is None) or (self.callbacks[0][0] <= deadline_ns)):
+                at_ns, _, callback = heapq.heappop(self.callbacks)
+                self.ns = max(self.ns, at_ns)
+                callback()
+                continue
+            if deadline_ns is None:
+                raise RuntimeError("simulated session is waiting with no deadline and no scheduled input")
+            self.ns = max(self.ns, deadline_ns)
+            return predicate()
+        return True
+
+
+class totals_view(Mapping):
+    """
+    immutable task -> timedelta view of the session totals at one instant, plus 'total' and 'total*'.
+    built in O(1) from the accumulator's closed sums and the open segment; values are computed on lookup.
+    """
+    __slots__ = ('_closed', '_total_ns', '_total_star_ns', '_open_task', '_open_ns')
+
+    def __init__(self, closed, total_ns, total_star_ns, open_task=None, open_ns=0):
+        self._closed = closed
+        self._total_ns = total_ns
+        self._total_star_ns = total_star_ns
+        self._open_task = open_task
+        self._open_ns = open_ns
+
+    def ns(self, key):
+        if key == 'total':
+            return self._total_ns + self._open_ns
+        if key == 'total*':
+            if self._open_task in TOTAL_STAR_EXCLUDED:
+                return self._total_star_ns
+            return self._total_star_ns + self._open_ns
+        ns = self._closed[key]
+        if key == self._open_task:
+            ns += self._open_ns
+        return ns
+
+    def __getitem__(self, key):
+        return ns_to_timedelta(self.ns(key))
+
+    def __iter__(self):
+        yield from self._closed
+        yield 'total'
+        yield 'total*'
+
+    def __len__(self):
+        return len(self._closed)+2
+
+    def __repr__(self):
+        return 'totals_view({})'.format(dict(self))
+
+
+class timing_state(namedtuple('timing_state', [
+        'session_start_ns',
+        'session_start_wall',
+        # timeline segments: nanoseconds per task in closed segments (+ 'total' / 'total*' sums) and the open segment
+        'closed_ns',
+        'closed_total_ns',
+        'closed_total_star_ns',
+        'open_task',
+        'open_start_ns',
+        # the same per (task, focus), focus '' when there is none: nanoseconds in closed segments and the open segment's key
+        'closed_focus_ns',
+        'open_focus',
+        # current block: planned length, running time banked before the current segment, start of the current segment
+        'block_length_ns',
+        'block_run_ns',
+        'block_resume_ns',
+        ])):
+    """
+    immutable anchors of a session's time accounting. every instant is a monotonic ns reading, and everything
+    below is computed from the anchors in closed form for a given now_ns.
+    """
+    __slots__ = ()
+
+    def to_wall(self, ns):
+        return self.session_start_wall + ns_to_timedelta(ns - self.session_start_ns)
+
+    def session_elapsed_ns(self, now_ns):
+        if self.session_start_ns is None:
+            return 0
+        return now_ns - self.session_start_ns
+
+    def open_segment_ns(self, now_ns):
+        if self.open_task is None:
+            return 0
+        return now_ns - self.open_start_ns
+
+    def total_ns(self, task, now_ns):
+        total = self.closed_ns.get(task, 0)
+        if task == self.open_task:
+            total += self.open_segment_ns(now_ns)
+        return total
+
+    def totals(self, now_ns):
+        return totals_view(self.closed_ns, self.closed_total_ns, self.closed_total_star_ns, self.open_task, self.open_segment_ns(now_ns))
+
+    def focus_total_ns(self, focus_key, now_ns):
+        """ns spent on focus_key = (task, focus), the open segment included"""
+        total = self.closed_focus_ns.get(focus_key, 0)
+        if focus_key == self.open_focus:
+            total += self.open_segment_ns(now_ns)
+        return total
+
+    def block_elapsed_ns(self, now_ns):
+        if self.block_resume_ns is None:
+            return self.block_run_ns
+        return self.block_run_ns + (now_ns - self.block_resume_ns)
+
+    def block_remaining_ns(self, now_ns):
+        if self.block_length_ns is None:
+            return 0
+        return max(self.block_length_ns - self.block_elapsed_ns(now_ns), 0)
+
+    def block_offset_deadline_ns(self, offset_ns):
+        """monotonic instant at which the running block reaches offset_ns of running time (None while suspended)"""
+        if self.block_resume_ns is None:
+            return None
+        return self.block_resume_ns + (offset_ns - self.block_run_ns)
+
+EMPTY_TIMING = timing_state(None, None, MappingProxyType({}), 0, 0, None, None, MappingProxyType({}), None, None, 0, None)
+
+
+class session_timing:
+    """
+    monotonic time accounting for a single session.
+
+    totals, block progress and block deadlines are computed in closed form from the anchors in self.state instead
+    of being accumulated tick by tick, so they neither drift nor jump when the wall clock changes. wall-clock
+    datetimes are only derived (from the one anchor taken at session start) when the session is serialized.
+    self.state is immutable and replaced on every change, so a reference to it is a consistent snapshot.
+    """
+    def __init__(self, clock=None):
+        if clock is None: clock = system_clock()
+        self.monotonic_ns = clock.monotonic_ns
+        self.now = clock.now
+        self.state = EMPTY_TIMING
+
+    def now_ns(self):
+        return self.monotonic_ns()
+
+    def reset(self, tasks=()):
+        self.state = EMPTY_TIMING._replace(closed_ns=MappingProxyType({task: 0 for task in tasks}))
+
+    def start_session(self, tasks=(), start_ns=None, start_wall=None):
+        if start_ns is None: start_ns = self.monotonic_ns()
+        if start_wall is None: start_wall = self.now()
+        self.reset(tasks)
+        self.state = self.state._replace(session_start_ns=start_ns, session_start_wall=start_wall)
+        return self.state.session_start_ns
+
+    #### TIMELINE SEGMENTS
+    def open_segment(self, task, now_ns, focus=None):
+        self.state = self.state._replace(open_task=task, open_start_ns=now_ns, open_focus=(task, focus if focus is not None else ''))
+
+    def close_segment(self, now_ns):
+        state = self.state
+        if state.open_task is None:
+            return 0
+        length_ns = now_ns - state.open_start_ns
+        closed_ns = dict(state.closed_ns)
+        closed_ns[state.open_task] = closed_ns.get(state.open_task, 0) + length_ns
+        total_star_ns = state.closed_total_star_ns
+        if state.open_task not in TOTAL_STAR_EXCLUDED:
+            total_star_ns += length_ns
+        closed_focus_ns = dict(state.closed_focus_ns)
+        closed_focus_ns[state.open_focus] = closed_focus_ns.get(state.open_focus, 0) + length_ns
+        self.state = state._replace(
+            closed_ns=MappingProxyType(closed_ns),
+            closed_total_ns=state.closed_total_ns+length_ns,
+            closed_total_star_ns=total_star_ns,
+            open_task=None,
+            open_start_ns=None,
+            closed_focus_ns=MappingProxyType(closed_focus_ns),
+            open_focus=None)
+        return length_ns
+
+    #### CURRENT BLOCK
+    def start_block(self, length_ns):
+        self.state = self.state._replace(block_length_ns=length_ns, block_run_ns=0, block_resume_ns=None)
+
+    def resume_block(self, now_ns):
+        self.state = self.state._replace(block_resume_ns=now_ns)
+
+    def suspend_block(self, now_ns):
+        state = self.state
+        if state.block_resume_ns is not None:
+            self.state = state._replace(block_run_ns=state.block_run_ns + (now_ns - state.block_resume_ns), block_resume_ns=None)